@@ -7,6 +7,7 @@ import xlsxwriter
 from PIL import Image
 
 MAX_NUM_COLORS = 65490  # The maximum amount of decorators allowed in one XLSX file.
+HEX_BYTES = np.array([f"{i:02x}" for i in range(256)])  # Two-digit hex string for every channel value.
 
 
 def validate_CLI():
@@ -83,61 +84,61 @@ def load_image_from_file(filename: str) -> Image:
     :param filename: Path to file containing image to be converted
     :return: loaded PIL image
     """
-    try:
-        picture = Image.open(filename)
-        picture.load()
-        picture.convert('RGB')
-        return picture
-    except Exception as err:
-        raise err
+    with Image.open(filename) as picture:
+        return picture.convert('RGB')
 
 
 def adjust_image_for_xslx_compatibility(pil_img: Image) -> np.array:
     """
     If the image contains more colours than Excel allows in one workbook,
-    then the size of the image is reduced incrementally
-    until the number of unique colors is less than this maximum amount.
+    then the size of the image is reduced until the number of unique colors is less than this maximum amount.
+    The number of unique colours in natural images scales roughly with the pixel count, so each reduction is
+    estimated from the current count; this usually needs a single resize.
 
     :param pil_img: Image object (PIL).
     :return: rgb_array: Numpy array containing each individual pixel's RGB value.
     """
-    max_width = float('inf')
-    unique_colours = np.empty(MAX_NUM_COLORS)
     resized = False
     print("Validating image color profile...")
-    while len(unique_colours) >= MAX_NUM_COLORS:  # This runs at least once, as the initial array will be too large.
-        rgb_array = convert_pil_img_to_rgb_array(pil_img)
-        _, unique_colours = np.unique(rgb_array.reshape(-1, 3), axis=0, return_counts=1)
+    rgb_array = convert_pil_img_to_rgb_array(pil_img)
+    num_colours = count_unique_colours(rgb_array)
+    while num_colours >= MAX_NUM_COLORS:
+        img_w, img_h = pil_img.size
+        factor = min(0.95, math.sqrt(MAX_NUM_COLORS / num_colours) * 0.97)
+        pil_img = resize_img(pil_img, img_w, img_h, factor)
+        resized = True
 
-        if len(unique_colours) >= MAX_NUM_COLORS:
-            img_w, img_h = pil_img.size
-            if img_w <= max_width:
-                max_width = img_w
-            pil_img = resize_img(pil_img, img_w, img_h)
-            resized = True
+        rgb_array = convert_pil_img_to_rgb_array(pil_img)
+        num_colours = count_unique_colours(rgb_array)
 
     if resized:
         print(f"Image adjusted in size to ensure xslx compatibility. "
-              f"New dimensions: {pil_img.size[0]} x {pil_img.size[1]} px with {len(unique_colours)} colours...")
+              f"New dimensions: {pil_img.size[0]} x {pil_img.size[1]} px with {num_colours} colours...")
     else:
         print("Image valid...")
 
     return rgb_array
 
 
-def resize_img(img: Image, img_w: int, img_h: int) -> Image:
+def resize_img(img: Image, img_w: int, img_h: int, factor: float = 0.8) -> Image:
     """
-    Resizes the image by a reduction factor of 20%.
+    Resizes the image by the given scale factor (a reduction of 20% by default).
+    A box filter is used, as it is the cheapest resampler which still averages every source pixel when downscaling.
+    Large reductions are first done by a whole number with `Image.reduce`, leaving only a small final resize.
 
     :param img: Original PIL image.
     :param img_w: Original image width.
     :param img_h: Original image height.
-    :return: res: PIL image, with dimensions reduced by 20%.
+    :param factor: Scale applied to both dimensions.
+    :return: res: PIL image, with dimensions scaled by `factor`.
     """
-    new_width = math.floor(img_w * 0.8)  # Rounding down is best for our application.
-    new_height = math.floor(img_h * 0.8)
+    new_width = math.floor(img_w * factor)  # Rounding down is best for our application.
+    new_height = math.floor(img_h * factor)
+    reduction = math.floor(1 / factor)  # Whole-number part of the reduction
     try:
-        res = img.resize((new_width, new_height))
+        if reduction >= 2 and min(img_w, img_h) >= 2 * reduction:
+            img = img.reduce(reduction)
+        res = img.resize((new_width, new_height), Image.BOX)
         return res
     except ValueError:
         raise ValueError
@@ -151,25 +152,48 @@ def convert_pil_img_to_rgb_array(pil_img: Image) -> Image:
     :param pil_img: Original PIL Image.
     :return: Image: PIL Image converted to NumPy array.
     """
-    return np.asarray(pil_img, dtype="uint32")
+    return np.asarray(pil_img, dtype="uint8")
 
 
-def convert_rgb_array_to_hex_array(rgb_arr: np.array) -> np.array:
+def pack_rgb_array(rgb_arr: np.array) -> np.array:
+    """
+    Packs each pixel's RGB value into a single integer (0xRRGGBB).
+
+    :param rgb_arr: NumPy array containing RGB values.
+    :return: NumPy array of uint32, of shape (image_height, image_width).
+    """
+    return ((rgb_arr[..., 0].astype(np.uint32) << 16)
+            | (rgb_arr[..., 1].astype(np.uint32) << 8)
+            | rgb_arr[..., 2].astype(np.uint32))
+
+
+def count_unique_colours(rgb_arr: np.array) -> int:
     """
-    Maps the function `rgb_array_to_hex_string` over every item in the np array.
-    Speed is increased by converting from a flattening the array, mapping the function,
-    and then converting back to a 3d array.
-    Taken from: https://stackoverflow.com/questions/22424096/apply-functions-to-3d-numpy-array
+    Counts the unique colours in an RGB array.
+    Each packed pixel marks its slot in a table covering every possible 24-bit colour,
+    so the count takes one pass over the pixels rather than a sort.
 
     :param rgb_arr: NumPy array containing RGB values.
-    :return: reshaped_arr: NumPy array containing hex values.
+    :return: Number of unique colours.
     """
-    x, y, z = rgb_arr.shape
+    seen = np.zeros(1 << 24, dtype=np.bool_)
+    seen[pack_rgb_array(rgb_arr).ravel()] = True
+    return int(np.count_nonzero(seen))
 
-    reshaped_arr = rgb_arr.reshape(x * y, z)
-    reshaped_arr = np.apply_along_axis(rgb_array_to_hex_string, 1, reshaped_arr)
-    reshaped_arr = reshaped_arr.reshape(x, y, 1)
-    return reshaped_arr
+
+def convert_rgb_array_to_hex_array(rgb_arr: np.array) -> np.array:
+    """
+    Converts every RGB value in the array to a hex string.
+    Each channel is looked up in `HEX_BYTES` and the three results are concatenated,
+    so the whole conversion happens in NumPy rather than one Python call per pixel.
+
+    :param rgb_arr: NumPy array containing RGB values.
+    :return: hex_arr: NumPy array containing hex values, of shape (image_height, image_width, 1).
+    """
+    hex_arr = np.char.add(HEX_BYTES[rgb_arr[..., 0]], HEX_BYTES[rgb_arr[..., 1]])
+    hex_arr = np.char.add(hex_arr, HEX_BYTES[rgb_arr[..., 2]])
+    hex_arr = np.char.add('#', hex_arr)
+    return hex_arr[..., np.newaxis]
 
 
 def rgb_array_to_hex_string(cell: list) -> str:
@@ -183,34 +207,47 @@ def rgb_array_to_hex_string(cell: list) -> str:
 
 
 def make_excel_file(filename: str) -> (xlsxwriter.Workbook.worksheet_class, xlsxwriter.Workbook):
-    wb = xlsxwriter.Workbook(f'output/{filename}.xlsx')  # Create new workbook at this location
+    # Create new workbook at this location. Rows are flushed to disk as soon as the next row is started.
+    wb = xlsxwriter.Workbook(f'output/{filename}.xlsx', {'constant_memory': True})
     ws = wb.add_worksheet()
     return ws, wb
 
 
+def find_colour_runs(hex_row: np.array) -> (np.array, np.array):
+    """
+    Finds the runs of consecutive cells sharing a colour in one row of the hex array.
+
+    :param hex_row: 1D NumPy array containing the hex values of a single row.
+    :return: starts, lengths: NumPy arrays containing the first column and length of each run.
+    """
+    starts = np.flatnonzero(np.concatenate(([True], hex_row[1:] != hex_row[:-1])))
+    lengths = np.diff(np.append(starts, len(hex_row)))
+    return starts, lengths
+
+
 def write_cells(arr: np.array, ws: xlsxwriter.Workbook.worksheet_class, wb: xlsxwriter.Workbook, cell_size: int):
     """
-    Writes array of pixels to spreadsheet, incrementally formatting each cell as it goes through.
+    Writes array of pixels to spreadsheet, formatting each cell as it goes through.
+    One format is created per unique colour up front and shared by every cell of that colour,
+    and each run of same-coloured cells in a row is written with a single call.
+    The worksheet must be written top to bottom, as workbooks are opened in constant memory mode.
 
     :param arr: NumPy array containing hex values for pixel of the final image to be written.
     :param ws: xlsxwriter worksheet
     :param wb: xlsx workbook
     :param cell_size: desired cell height in pixels
     """
-    row_num = 0
-    col_num = 0
-    for row in arr:
-        ws.set_row_pixels(row_num, cell_size)  # Set row height
-        for col in row:
-            cell_format = wb.add_format()  # Add format to cell
-            cell_format.set_bg_color(col[0])
-            ws.write(row_num, col_num, '', cell_format)
-            col_num += 1
-        col_num = 0  # Reset to 0 at end of line
-        row_num += 1
+    fmt_cache = {h: wb.add_format({'bg_color': h}) for h in np.unique(arr)}
 
     num_cols_occupied = arr.shape[1] - 1
-    worksheet.set_column_pixels(0, num_cols_occupied, cell_size)  # Resize used columns to desired width
+    ws.set_column_pixels(0, num_cols_occupied, cell_size)  # Resize used columns to desired width
+    ws.set_default_row(cell_size * 0.75)  # Set every row's height; rows are measured in points, not pixels
+
+    for row_num, row in enumerate(arr[..., 0]):
+        starts, lengths = find_colour_runs(row)
+        for col_num, length in zip(starts.tolist(), lengths.tolist()):
+            ws.write_row(row_num, col_num, [''] * length, fmt_cache[row[col_num]])
+
     print("Worksheet filled successfully; please wait...")
 
 
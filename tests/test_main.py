@@ -2,6 +2,7 @@ import io
 import random
 import tempfile
 import unittest
+import zipfile
 from contextlib import redirect_stdout
 from pathlib import Path
 from unittest import TestCase
@@ -19,9 +20,13 @@ from main import (
     adjust_image_for_xslx_compatibility,
     resize_img,
     convert_pil_img_to_rgb_array,
+    pack_rgb_array,
+    count_unique_colours,
     convert_rgb_array_to_hex_array,
     rgb_array_to_hex_string,
-    make_excel_file
+    find_colour_runs,
+    make_excel_file,
+    write_cells
 )
 
 
@@ -99,7 +104,17 @@ class TestImageFunctions(TestCase):
             img = PIL.Image.new('RGB', (60, 60), color='white')
             img.save(dirpath)
             res = load_image_from_file(dirpath.name)
-            self.assertIsInstance(res, PIL.PngImagePlugin.PngImageFile)
+            self.assertIsInstance(res, PIL.Image.Image)
+            self.assertEqual(res.mode, 'RGB')
+
+        # Palette and RGBA images are converted to RGB
+        for mode in ['P', 'RGBA']:
+            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as dirpath:
+                img = PIL.Image.new(mode, (60, 60))
+                img.save(dirpath)
+                res = load_image_from_file(dirpath.name)
+                self.assertEqual(res.mode, 'RGB')
+                self.assertEqual(convert_pil_img_to_rgb_array(res).shape, (60, 60, 3))
 
         # Pass in file which cannot be opened due to unacceptable extension
         with tempfile.NamedTemporaryFile(suffix='.txt', delete=False) as dirpath:
@@ -123,7 +138,7 @@ class TestImageFunctions(TestCase):
             res = adjust_image_for_xslx_compatibility(img)
         self.assertEqual('Validating image color profile...\n'
                          'Image adjusted in size to ensure xslx compatibility. '
-                         'New dimensions: 419 x 202 px with 54165 colours...\n', buf.getvalue())
+                         'New dimensions: 448 x 216 px with 60565 colours...\n', buf.getvalue())
         self.assertIsInstance(res, np.ndarray)
         self.assertEqual(res.ndim, 3)
 
@@ -138,6 +153,15 @@ class TestImageFunctions(TestCase):
         res = resize_img(img, 25, 25)
         self.assertEqual(res.size, (20, 20))
 
+        # Input valid image with an explicit factor
+        res = resize_img(img, 25, 25, 0.5)
+        self.assertEqual(res.size, (12, 12))
+
+        # Input valid image with a factor large enough to use an integer reduction first
+        img = PIL.Image.new('RGB', (100, 60), color='white')
+        res = resize_img(img, 100, 60, 0.3)
+        self.assertEqual(res.size, (30, 18))
+
     def test_convert_pil_img_to_rgb_array(self):
         # All-white image, check every for 255, 255, 255
         img = PIL.Image.new('RGB', (5, 5), color='white')
@@ -151,6 +175,20 @@ class TestImageFunctions(TestCase):
         for row in arr:
             self.assertTrue((row == 0).all())
 
+    def test_pack_rgb_array(self):
+        rgb_arr = np.array([[[107, 168, 50], [255, 0, 212]]], dtype="uint8")
+        packed = pack_rgb_array(rgb_arr)
+        self.assertEqual(packed.shape, (1, 2))
+        self.assertEqual(packed[0, 0], 0x6ba832)
+        self.assertEqual(packed[0, 1], 0xff00d4)
+
+    def test_count_unique_colours(self):
+        img = PIL.Image.new('RGB', (5, 5), color='white')
+        self.assertEqual(count_unique_colours(convert_pil_img_to_rgb_array(img)), 1)
+
+        rgb_arr = np.array([[[0, 0, 1], [0, 1, 0], [1, 0, 0], [0, 0, 1]]], dtype="uint8")
+        self.assertEqual(count_unique_colours(rgb_arr), 3)
+
     def test_convert_rgb_array_to_hex_array(self):
         img = PIL.Image.new('RGB', (5, 5), color='white')
         rgb_arr = convert_pil_img_to_rgb_array(img)
@@ -186,5 +224,36 @@ class TestXLSXFunctions(TestCase):
         self.assertIsInstance(workbook, xlsxwriter.Workbook)
         self.assertIsInstance(worksheet, xlsxwriter.Workbook.worksheet_class)
 
+    def test_find_colour_runs(self):
+        row = np.array(['#000000', '#000000', '#ffffff', '#000000', '#000000', '#000000'])
+        starts, lengths = find_colour_runs(row)
+        self.assertEqual(starts.tolist(), [0, 2, 3])
+        self.assertEqual(lengths.tolist(), [2, 1, 3])
+
+        # Single colour
+        starts, lengths = find_colour_runs(np.array(['#ffffff'] * 4))
+        self.assertEqual(starts.tolist(), [0])
+        self.assertEqual(lengths.tolist(), [4])
+
     def test_write_cells(self):
-        pass
+        hex_arr = np.array([[['#000000'], ['#000000'], ['#ffffff']],
+                            [['#ff00d4'], ['#000000'], ['#000000']]])
+        with tempfile.TemporaryDirectory() as dirpath:
+            file_path = Path(dirpath) / 'file.xlsx'
+            workbook = xlsxwriter.Workbook(file_path, {'constant_memory': True})
+            worksheet = workbook.add_worksheet()
+            with redirect_stdout(io.StringIO()):
+                write_cells(hex_arr, worksheet, workbook, 4)
+            workbook.close()
+
+            with zipfile.ZipFile(file_path) as xlsx:
+                sheet = xlsx.read('xl/worksheets/sheet1.xml').decode()
+                styles = xlsx.read('xl/styles.xml').decode()
+
+        # Every pixel is written as its own cell, with one fill per unique colour
+        self.assertEqual(sheet.count('<c '), 6)
+        self.assertEqual(sheet.count('<row '), 2)
+        self.assertEqual(sheet.count('ht="3"'), 2)  # 4 px rows are 3 points high
+        self.assertIn('<col min="1" max="3" ', sheet)
+        for colour in ['FF000000', 'FFFFFFFF', 'FFFF00D4']:
+            self.assertEqual(styles.count(f'<fgColor rgb="{colour}"/>'), 1)